@@ -2,190 +2,276 @@ import streamlit as st
 import re
 import sys
 import os
-import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
 from pathlib import Path
 from collections import defaultdict
 from urllib.parse import urlparse
 import tiktoken
 
 # Import the core functionality from the main script
-from rag_optimizer import process_markdown_file
+from rag_optimizer import process_markdown_string
 
-# Set page configuration
-st.set_page_config(
-    page_title="Deep Research Document Optimizer",
-    page_icon="📄",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Load each tokenizer once per process; a plain lru_cache would be rebuilt on every
+# Streamlit rerun because the whole script is executed again
+@st.cache_resource(show_spinner=False)
+def _get_encoder(model):
+    """Return the tiktoken encoding for a model"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Fallback to cl100k_base encoding if model-specific encoding is not found
+        return tiktoken.get_encoding("cl100k_base")
+
+# Token counting encodes the text in pieces of roughly this many characters, so only
+# one piece's token list is alive at a time instead of one for the whole document
+TOKEN_COUNT_CHUNK_CHARS = 64 * 1024
+
+# A lone line break between two non-space characters always ends a tiktoken
+# pre-token ("/" is excluded because o200k can glue it onto preceding newlines),
+# so cutting the text there gives exactly the same token count as encoding it whole
+_TOKEN_CHUNK_BOUNDARY_RE = re.compile(r'(?<=\S)\n(?=[^\s/])')
+
+def _split_for_counting(text):
+    """Split text into pieces that can be tokenized independently"""
+    start = 0
+    while len(text) - start > TOKEN_COUNT_CHUNK_CHARS:
+        boundary = _TOKEN_CHUNK_BOUNDARY_RE.search(text, start + TOKEN_COUNT_CHUNK_CHARS)
+        if boundary is None:
+            break
+        yield text[start:boundary.end()]
+        start = boundary.end()
+    yield text[start:]
 
 # Function to count tokens using tiktoken
-def count_tokens(text, model="gpt-4"):
-    """Count the number of tokens in a text string"""
+def count_tokens_batch(texts, model="gpt-4"):
+    """Count the number of tokens in several text strings with batched tiktoken calls"""
+    encoder = _get_encoder(model)
+    num_threads = os.cpu_count() or 1
+    
+    pieces = [(i, piece) for i, text in enumerate(texts) for piece in _split_for_counting(text)]
+    counts = [0] * len(texts)
+    
+    # Encode one piece per thread at a time to keep the token lists short-lived;
+    # uploaded Markdown is plain text, so skip the special-token scan
+    for start in range(0, len(pieces), num_threads):
+        window = pieces[start:start + num_threads]
+        encoded = encoder.encode_ordinary_batch([piece for _, piece in window], num_threads=num_threads)
+        for (i, _), tokens in zip(window, encoded):
+            counts[i] += len(tokens)
+    
+    return counts
+
+# Average characters per token for English text with OpenAI's BPE encodings
+CHARS_PER_TOKEN = 4
+
+def count_tokens_approx(text):
+    """Estimate the number of tokens in a text string without running the tokenizer"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+# One worker pool per server process, shared by every session and rerun. Workers are
+# spawned rather than forked because Streamlit serves sessions from several threads,
+# and a fork could copy a lock another thread is holding into the child
+@st.cache_resource(show_spinner=False)
+def _get_process_pool():
+    """Return the process pool used to optimize several documents at once"""
+    return ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+# Function to optimize several documents in the shared worker pool
+def process_documents(contents, group_by_domain, keep_domain_names):
+    """Run process_markdown_string over several Markdown texts in parallel"""
+    # Handing work to the pool costs more than optimizing a single document
+    if len(contents) <= 1:
+        return [process_markdown_string(content, group_by_domain, keep_domain_names) for content in contents]
+    
     try:
-        encoder = tiktoken.encoding_for_model(model)
-        return len(encoder.encode(text))
-    except:
-        # Fallback to cl100k_base encoding if model-specific encoding is not found
-        encoder = tiktoken.get_encoding("cl100k_base")
-        return len(encoder.encode(text))
-
-# Main app layout
-st.title("Deep Research Document Optimizer")
-st.subheader("Optimize deep research documents for RAG systems")
-
-with st.expander("About this tool", expanded=True):
-    st.markdown("""
-    This specialized tool optimizes OpenAI deep research documents for Retrieval-Augmented Generation (RAG) systems by:
-    
-    - Extracting URLs and replacing them with numbered citations
-    - Creating a references section at the end of the document
-    - Grouping references by domain (optional)
-    - Maintaining domain names in citations (optional)
-    - **Note**: This is not a general markdown optimizer! Non-deep research documents may result in an increase in tokens
-    - **Privacy Notice**: Your data is processed entirely in-memory and is cleared when the app restarts, your session ends, or you close the browser tab. No document content is stored or retained after processing.
-    """)
-
-# Sidebar options
-st.sidebar.header("Configuration")
-group_domains = st.sidebar.checkbox("Group references by domain", value=True)
-keep_domains = st.sidebar.checkbox("Keep domain names in citations", value=True)
-model_option = st.sidebar.selectbox(
-    "Token counting model",
-    options=["gpt-3.5-turbo", "gpt-4", "claude-3", "llama-3"],
-    index=1
-)
-
-# File upload section
-st.header("Upload Markdown Files")
-uploaded_files = st.file_uploader("Choose Markdown files", type=["md", "txt"], accept_multiple_files=True)
-
-# Track file changes to clean up session state
-if 'uploaded_file_names' not in st.session_state:
-    st.session_state.uploaded_file_names = []
-
-# Get current file names
-current_files = [f.name for f in uploaded_files] if uploaded_files else []
-
-# Check if files were removed and clean up session state
-if 'processed_files' in st.session_state:
-    for file_name in list(st.session_state.processed_files.keys()):
-        if file_name not in current_files:
-            # Remove this file from processed files as it's no longer in the uploader
-            st.session_state.processed_files.pop(file_name, None)
-
-# Update the list of file names
-st.session_state.uploaded_file_names = current_files
-
-if uploaded_files:
-    st.success(f"{len(uploaded_files)} file(s) uploaded successfully!")
-    
-    # Create a container for the file processing results
-    results_container = st.container()
-    
-    # Process button
-    if st.button("Process Files", key="process_button"):
-        processed_files = {}
-        with st.spinner("Processing files..."):
-            for uploaded_file in uploaded_files:
-                # Create temp files for processing
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".md") as temp_input:
-                    temp_input.write(uploaded_file.getvalue())
-                    input_path = temp_input.name
-                
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".md") as temp_output:
-                    output_path = temp_output.name
-                
-                # Process the file
-                process_markdown_file(input_path, output_path, group_domains, keep_domains)
-                
-                # Read the processed file
-                with open(output_path, 'r', encoding='utf-8') as f:
-                    processed_content = f.read()
-                
-                # Calculate stats
-                original_content = uploaded_file.getvalue().decode('utf-8')
-                original_size = len(original_content.encode('utf-8'))
-                processed_size = len(processed_content.encode('utf-8'))
-                original_tokens = count_tokens(original_content, model_option)
-                processed_tokens = count_tokens(processed_content, model_option)
-                
-                # Store in dictionary for this session
-                processed_files[uploaded_file.name] = {
-                    'original_content': original_content,
-                    'processed_content': processed_content,
-                    'original_size': original_size,
-                    'processed_size': processed_size,
-                    'original_tokens': original_tokens,
-                    'processed_tokens': processed_tokens
-                }
-                
-                # Clean up temp files
-                os.unlink(input_path)
-                os.unlink(output_path)
-            
-            # Store in session state so we can access across interactions
-            st.session_state.processed_files = processed_files
-    
-    # Display processed files if available
-    if hasattr(st.session_state, 'processed_files') and st.session_state.processed_files:
-        with results_container:
-            for file_name, result in st.session_state.processed_files.items():
-                # Only display results for files that are currently uploaded
-                if file_name in current_files:
-                    st.subheader(f"Results for {file_name}")
-                    
-                    # Side-by-side comparison
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        st.markdown("### Original Document")
-                        st.text_area("", result['original_content'], height=300, key=f"orig_{file_name}")
-                        st.info(f"Size: {result['original_size']} bytes | Tokens: {result['original_tokens']}")
-                    
-                    with col2:
-                        st.markdown("### Optimized Document")
-                        st.text_area("", result['processed_content'], height=300, key=f"proc_{file_name}")
-                        st.info(f"Size: {result['processed_size']} bytes | Tokens: {result['processed_tokens']}")
-                    
-                    # Token savings
-                    token_diff = result['original_tokens'] - result['processed_tokens']
-                    token_percent = (token_diff / result['original_tokens'] * 100) if result['original_tokens'] > 0 else 0
-                    
-                    if token_diff > 0:
-                        st.success(f"Saved {token_diff} tokens ({token_percent:.1f}% reduction)")
-                    elif token_diff < 0:
-                        st.warning(f"Increased by {abs(token_diff)} tokens ({abs(token_percent):.1f}% increase)")
-                    else:
-                        st.info("No change in token count")
-                    
-                    # Download button and celebration
-                    download_key = f"downloaded_{file_name}"
-                    if download_key not in st.session_state:
-                        st.session_state[download_key] = False
-                    
-                    # Download button
-                    download_clicked = st.download_button(
-                        label="Download Optimized File",
-                        data=result['processed_content'].encode('utf-8'),
-                        file_name=f"optimized_{file_name}",
-                        mime="text/markdown",
-                        key=f"download_{file_name}"
-                    )
-                    
-                    # Check if button was just clicked
-                    if download_clicked:
-                        st.session_state[download_key] = True
-                    
-                    # Show celebration if downloaded
-                    if st.session_state[download_key]:
-                        st.success("🎉 Successfully optimized and downloaded! Your RAG system will thank you!")
-                    
-                    st.markdown("---")
-
-else:
-    st.info("Please upload one or more Markdown files to begin")
-
-# Footer
-st.markdown("---")
-st.markdown("Made with ❤️ by Carlos | [GitHub Repository](https://github.com/gptkitty/openai-doc-optimizer)")
+        return list(_get_process_pool().map(
+            process_markdown_string, contents, repeat(group_by_domain), repeat(keep_domain_names)
+        ))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); replace the pool so later runs still work
+        _get_process_pool.clear()
+        raise
+
+# Streamlit reruns the whole script on every widget interaction; reuse earlier
+# results for the same documents and options instead of recomputing them
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_process(contents, group_by_domain, keep_domain_names):
+    return process_documents(list(contents), group_by_domain, keep_domain_names)
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _cached_count(texts, model):
+    return count_tokens_batch(list(texts), model)
+
+# Function to optimize the uploaded files and collect what the results view shows
+def _process_files(uploaded_files, group_by_domain, keep_domain_names):
+    """Process uploaded files in memory, returning a result dictionary per file name"""
+    processed_files = {}
+    original_contents = [f.getvalue().decode('utf-8') for f in uploaded_files]
+    processed_contents = _cached_process(tuple(original_contents), group_by_domain, keep_domain_names)
+    
+    for i, uploaded_file in enumerate(uploaded_files):
+        original_content = original_contents[i]
+        processed_content = processed_contents[i]
+        processed_bytes = processed_content.encode('utf-8')
+        
+        # Store in dictionary for this session
+        processed_files[uploaded_file.name] = {
+            'original_content': original_content,
+            'processed_content': processed_content,
+            'processed_bytes': processed_bytes,
+            'original_size': uploaded_file.size,
+            'processed_size': len(processed_bytes)
+        }
+    
+    return processed_files
+
+# Function to show the comparison, token savings and download button for one file
+def _render_result(file_name, result, model):
+    """Render the results for a processed file"""
+    st.subheader(f"Results for {file_name}")
+    
+    # Side-by-side comparison
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("### Original Document")
+        st.text_area("", result['original_content'], height=300, key=f"orig_{file_name}")
+        st.info(f"Size: {result['original_size']} bytes | Tokens: ~{count_tokens_approx(result['original_content'])}")
+    
+    with col2:
+        st.markdown("### Optimized Document")
+        st.text_area("", result['processed_content'], height=300, key=f"proc_{file_name}")
+        st.info(f"Size: {result['processed_size']} bytes | Tokens: ~{count_tokens_approx(result['processed_content'])}")
+    
+    # Token savings, counted exactly with the selected model's tokenizer
+    original_tokens, processed_tokens = _cached_count(
+        (result['original_content'], result['processed_content']), model
+    )
+    token_diff = original_tokens - processed_tokens
+    token_percent = (token_diff / original_tokens * 100) if original_tokens > 0 else 0
+    
+    if token_diff > 0:
+        st.success(f"Saved {token_diff} tokens ({token_percent:.1f}% reduction)")
+    elif token_diff < 0:
+        st.warning(f"Increased by {abs(token_diff)} tokens ({abs(token_percent):.1f}% increase)")
+    else:
+        st.info("No change in token count")
+    
+    # Download button and celebration
+    download_key = f"downloaded_{file_name}"
+    if download_key not in st.session_state:
+        st.session_state[download_key] = False
+    
+    # Download button
+    download_clicked = st.download_button(
+        label="Download Optimized File",
+        data=result['processed_bytes'],
+        file_name=f"optimized_{file_name}",
+        mime="text/markdown",
+        key=f"download_{file_name}"
+    )
+    
+    # Check if button was just clicked
+    if download_clicked:
+        st.session_state[download_key] = True
+    
+    # Show celebration if downloaded
+    if st.session_state[download_key]:
+        st.success("🎉 Successfully optimized and downloaded! Your RAG system will thank you!")
+    
+    st.markdown("---")
+
+# Page layout; the worker processes spawned by _get_process_pool re-import this script
+# as __mp_main__, so it only renders when Streamlit runs it as __main__
+def main():
+    """Render the optimizer page"""
+    # Set page configuration
+    st.set_page_config(
+        page_title="Deep Research Document Optimizer",
+        page_icon="📄",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+    
+    # Main app layout
+    st.title("Deep Research Document Optimizer")
+    st.subheader("Optimize deep research documents for RAG systems")
+    
+    with st.expander("About this tool", expanded=True):
+        st.markdown("""
+        This specialized tool optimizes OpenAI deep research documents for Retrieval-Augmented Generation (RAG) systems by:
+    
+        - Extracting URLs and replacing them with numbered citations
+        - Creating a references section at the end of the document
+        - Grouping references by domain (optional)
+        - Maintaining domain names in citations (optional)
+        - **Note**: This is not a general markdown optimizer! Non-deep research documents may result in an increase in tokens
+        - **Privacy Notice**: Your data is processed entirely in-memory and is cleared when the app restarts, your session ends, or you close the browser tab. No document content is stored or retained after processing.
+        """)
+    
+    # Sidebar options
+    st.sidebar.header("Configuration")
+    group_domains = st.sidebar.checkbox("Group references by domain", value=True)
+    keep_domains = st.sidebar.checkbox("Keep domain names in citations", value=True)
+    model_option = st.sidebar.selectbox(
+        "Token counting model",
+        options=["gpt-3.5-turbo", "gpt-4", "claude-3", "llama-3"],
+        index=1
+    )
+    
+    # File upload section
+    st.header("Upload Markdown Files")
+    uploaded_files = st.file_uploader("Choose Markdown files", type=["md", "txt"], accept_multiple_files=True)
+    
+    # Track file changes to clean up session state
+    if 'uploaded_file_names' not in st.session_state:
+        st.session_state.uploaded_file_names = []
+    
+    # Get current file names
+    current_files = [f.name for f in uploaded_files] if uploaded_files else []
+    
+    # Check if files were removed and clean up session state
+    if 'processed_files' in st.session_state:
+        for file_name in list(st.session_state.processed_files.keys()):
+            if file_name not in current_files:
+                # Remove this file from processed files as it's no longer in the uploader
+                st.session_state.processed_files.pop(file_name, None)
+    
+    # Update the list of file names
+    st.session_state.uploaded_file_names = current_files
+    
+    if uploaded_files:
+        st.success(f"{len(uploaded_files)} file(s) uploaded successfully!")
+    
+        # Create a container for the file processing results
+        results_container = st.container()
+    
+        # Process button
+        if st.button("Process Files", key="process_button"):
+            with st.spinner("Processing files..."):
+                # Store in session state so we can access across interactions
+                st.session_state.processed_files = _process_files(uploaded_files, group_domains, keep_domains)
+    
+        # Display processed files if available
+        if hasattr(st.session_state, 'processed_files') and st.session_state.processed_files:
+            with results_container:
+                for file_name, result in st.session_state.processed_files.items():
+                    # Only display results for files that are currently uploaded
+                    if file_name in current_files:
+                        _render_result(file_name, result, model_option)
+    
+    else:
+        st.info("Please upload one or more Markdown files to begin")
+    
+    # Footer
+    st.markdown("---")
+    st.markdown("Made with ❤️ by Carlos | [GitHub Repository](https://github.com/gptkitty/openai-doc-optimizer)")
+
+if __name__ == "__main__":
+    main()
@@ -1,120 +1,348 @@
+from __future__ import annotations
+
+import os
 import re
+import shutil
 import sys
+import threading
+import uuid
 from pathlib import Path
 from collections import defaultdict
+from typing import Any, Callable
 from urllib.parse import urlparse
 
-def process_markdown_file(input_file, output_file, group_by_domain=True, keep_domain_names=True):
+# Use the Rust implementation of the citation pass when it is installed
+# (pip install ./rag_optimizer_rs); it produces identical output
+_optimize_markdown_native: Callable[[str, bool, bool], tuple[str, int]] | None
+try:
+    from rag_optimizer_rs import optimize_markdown as _optimize_markdown_native  # type: ignore
+except ImportError:
+    _optimize_markdown_native = None
+
+# Regular expression to find Markdown links with URLs, citation-style links and raw URLs
+# in a single pass. Matches [text](url) patterns, domain[citation] patterns and bare
+# http(s) URLs; raw URLs stop at characters that cannot end a URL in prose (brackets,
+# quotes, trailing punctuation) instead of running to the next whitespace, but keep
+# balanced parentheses such as https://en.wikipedia.org/wiki/Foo_(bar)
+_MARKDOWN_URL_RE = re.compile(
+    r'(?P<link>\[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)]+)\))'
+    r'|(?P<citation>(?P<citation_domain>[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\[(?P<citation_num>\d+)\])'
+    r'|(?P<raw_url>(?<![(\w])\bhttps?://'
+    r'(?:[^\s<>"\'()\]]|\([^\s<>"\'()\]]*\))*'
+    r'(?:[^\s<>"\'()\].,;:!?]|\([^\s<>"\'()\]]*\)))'
+)
+
+# process_markdown_file reads and rewrites its input in blocks of whole lines
+# of about this many characters
+STREAM_BLOCK_CHARS = 1 << 20
+
+# Optional Hyperscan prefilter: one SIMD scan over the UTF-8 bytes finds every offset
+# where _MARKDOWN_URL_RE could start matching, so the re engine only runs there
+# instead of searching the whole document (pip install hyperscan)
+_HS_LINK, _HS_RAW_URL, _HS_CITATION = 0, 1, 2
+_hyperscan_db: Any = None
+_hyperscan_local = threading.local()
+try:
+    import hyperscan  # type: ignore[import-not-found, unused-ignore]
+except ImportError:
+    pass
+else:
+    _hyperscan_db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    _hyperscan_db.compile(
+        expressions=[
+            # Every link starts at a "[" and every raw URL at "http(s)://"
+            rb'\[',
+            rb'https?://',
+            # A domain[citation] can only start where a run of domain characters
+            # starts, which is the leftmost start Hyperscan reports for the run
+            rb'[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}\[',
+        ],
+        ids=[_HS_LINK, _HS_RAW_URL, _HS_CITATION],
+        elements=3,
+        flags=[0, hyperscan.HS_FLAG_SOM_LEFTMOST, hyperscan.HS_FLAG_SOM_LEFTMOST],
+    )
+
+def _candidate_starts(content: str) -> list[int]:
     """
-    Process a Markdown file to optimize it for RAG systems.
+    Return the sorted offsets in content where _MARKDOWN_URL_RE may match, using Hyperscan.
+    """
+    # Scratch space may not be shared between threads scanning at the same time
+    scratch = getattr(_hyperscan_local, 'scratch', None)
+    if scratch is None:
+        scratch = _hyperscan_local.scratch = hyperscan.Scratch(_hyperscan_db)
     
-    Args:
-        input_file (str): Path to the input Markdown file
-        output_file (str): Path to save the optimized output file
-        group_by_domain (bool): Whether to group references by domain
-        keep_domain_names (bool): Whether to keep domain names in citations
-        
-    Returns:
-        int: Number of unique URLs processed
+    data = content.encode('utf-8')
+    starts: set[int] = set()
+    
+    def on_match(expression_id: int, start: int, end: int, flags: int, context: Any) -> None:
+        # Without SOM_LEFTMOST Hyperscan reports 0 as the start of the "[" literal
+        starts.add(end - 1 if expression_id == _HS_LINK else start)
+    
+    _hyperscan_db.scan(data, match_event_handler=on_match, scratch=scratch)
+    byte_offsets = sorted(starts)
+    if len(data) == len(content):
+        return byte_offsets
+    
+    # Convert byte offsets to str offsets; every candidate is an ASCII character,
+    # so each slice between two of them is valid UTF-8
+    offsets = []
+    char_pos = byte_pos = 0
+    for offset in byte_offsets:
+        char_pos += len(data[byte_pos:offset].decode('utf-8'))
+        byte_pos = offset
+        offsets.append(char_pos)
+    return offsets
+
+def _sub_markdown_urls(replace: Callable[[re.Match[str]], str], content: str) -> str:
     """
-    # Read the input file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Initialize URL collection and counter
-    urls = []
-    url_map = {}
-    domain_groups = defaultdict(list) if group_by_domain else None
-    current_url_index = 1
-    
-    # Regular expression to find Markdown links with URLs and citation-style links
-    # Matches [text](url) patterns and domain[citation] patterns
-    link_pattern = r'\[([^\]]+)\]\(([^)]+)\)'
-    citation_pattern = r'([a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\[(\d+)\]'
-    
-    # Function to replace each URL with a citation number
-    def replace_url(match):
-        nonlocal current_url_index
-        text, url = match.groups()
-        
+    Equivalent of ``_MARKDOWN_URL_RE.sub(replace, content)``, prefiltered with Hyperscan if available.
+    """
+    if _hyperscan_db is None:
+        return _MARKDOWN_URL_RE.sub(replace, content)
+    
+    parts = []
+    pos = 0
+    for start in _candidate_starts(content):
+        if start < pos:
+            continue
+        match = _MARKDOWN_URL_RE.match(content, start)
+        if match is None:
+            continue
+        parts.append(content[pos:start])
+        parts.append(replace(match))
+        pos = match.end()
+    parts.append(content[pos:])
+    return "".join(parts)
+
+def _fast_netloc(url: str) -> str:
+    """
+    Return the network location of a URL, as ``urlparse(url).netloc`` would.
+    
+    http(s) URLs are sliced directly instead of going through ``urlparse``;
+    anything else falls back to it, including link URLs that contain a tab or
+    line break, which ``urlparse`` removes before splitting.
+    """
+    if '\t' in url or '\r' in url or '\n' in url:
+        return urlparse(url).netloc
+    if url.startswith('https://'):
+        start = 8
+    elif url.startswith('http://'):
+        start = 7
+    else:
+        return urlparse(url).netloc
+    
+    end = len(url)
+    for terminator in '/?#':
+        pos = url.find(terminator, start, end)
+        if pos >= 0:
+            end = pos
+    return url[start:end]
+
+def _may_contain_urls(text: str, keep_domain_names: bool) -> bool:
+    """
+    Cheap substring test for whether text could contain anything to rewrite.
+    """
+    # Every link needs "](", every raw URL starts with "http" and
+    # domain[citation] patterns only change when domain names are dropped
+    return "](" in text or "http" in text or (not keep_domain_names and "[" in text)
+
+def _link_may_continue(block: str, start: int) -> bool:
+    """
+    Whether the link alternative at block[start] could still match once more text is appended.
+    """
+    close = block.find(']', start)
+    if close < 0:
+        # The link text [^\]]+ runs to the end of the block
+        return True
+    # A "[text](" whose URL [^)]+ has not been closed yet
+    return close > start + 1 and block.startswith('(', close + 1) and block.find(')', close + 2) < 0
+
+def _stream_cut(block: str) -> int:
+    """
+    Return how much of a block can be rewritten before the following text is read.
+    
+    Links are the only matches that can span lines. A "[" the scan reaches whose link
+    is still open at the end of the block may become a link once the next lines are
+    read, so everything from there on is carried over to the next block.
+    """
+    # Only a "[" after the last "]", or before a "](" after the last ")", can be open
+    open_url = block.find('](', block.rfind(')') + 1)
+    start = block.find('[', block.rfind(']', 0, open_url if open_url >= 0 else len(block)) + 1)
+    
+    match: re.Match[str] | None = None
+    searched = False
+    while start >= 0:
+        if _link_may_continue(block, start):
+            if start == 0:
+                return 0
+            # The scan never reaches a "[" inside an earlier match, e.g. a raw URL
+            if not searched:
+                match = _MARKDOWN_URL_RE.search(block)
+                searched = True
+            while match is not None and match.end() <= start:
+                match = _MARKDOWN_URL_RE.search(block, match.end())
+            if match is None or match.start() > start:
+                return start
+        start = block.find('[', start + 1)
+    return len(block)
+
+class _CitationCollector:
+    """
+    Replaces URLs with numbered citations and collects them for the references section.
+    
+    A document may be fed through one collector in several pieces; citation numbers
+    carry over from one piece to the next.
+    """
+    
+    def __init__(self, keep_domain_names: bool) -> None:
+        self.keep_domain_names = keep_domain_names
+        # Map each unique URL to its citation number, in order of first appearance
+        self.url_map: dict[str, int] = {}
+    
+    def cite(self, url: str) -> int:
+        """Return the citation number for a URL, adding it to the collection if it is new"""
         # Clean up the URL if it has any extra markers
-        url = url.split('#')[0]  # Remove any anchors
+        anchor = url.find('#')  # Remove any anchors
+        if anchor >= 0:
+            url = url[:anchor]
         
         # If we haven't seen this URL before, add it to our collection
-        if url not in url_map:
-            url_map[url] = current_url_index
-            urls.append(url)
-            
-            if group_by_domain:
-                domain = urlparse(url).netloc
-                if domain not in domain_groups:
-                    domain_groups[domain] = []
-                domain_groups[domain].append((current_url_index, url))
-                
-            current_url_index += 1
+        index = self.url_map.get(url)
+        if index is None:
+            index = self.url_map[url] = len(self.url_map) + 1
+        return index
+    
+    def replace_match(self, match: re.Match[str]) -> str:
+        """Replacement callback for _MARKDOWN_URL_RE"""
+        kind = match.lastgroup
         
-        # Replace with citation number
-        return f"{text}[{url_map[url]}]"
-    
-    # Replace domain[citation] patterns if needed
-    if not keep_domain_names:
-        def replace_citation(match):
-            domain, citation_num = match.groups()
-            # We're not actually using the citation number, just removing the domain
-            return f"[{citation_num}]"
+        # Replace each URL with a citation number
+        if kind == 'link':
+            text, url = match.group('link_text', 'link_url')
+            return f"{text}[{self.cite(url)}]"
+        if kind == 'raw_url':
+            return f"[{self.cite(match.group('raw_url'))}]"
         
-        content = re.sub(citation_pattern, replace_citation, content)
-    
-    # Replace all Markdown links with citation numbers
-    content = re.sub(link_pattern, replace_url, content)
+        # Replace domain[citation] patterns if needed
+        if self.keep_domain_names:
+            return match.group(0)
+        # We're not actually using the citation number, just removing the domain
+        return f"[{match.group('citation_num')}]"
     
-    # Also find and replace any raw URLs
-    raw_url_pattern = r'(?<!\()(https?://[^\s]+)(?!\))'
-    
-    def replace_raw_url(match):
-        nonlocal current_url_index
-        url = match.group(1)
-        
-        # Clean up the URL if it has any extra markers
-        url = url.split('#')[0]  # Remove any anchors
+    def references(self, group_by_domain: bool) -> list[str]:
+        """Return the pieces of the references section for the collected URLs"""
+        parts = ["\n\n## References\n\n"]
         
-        # If we haven't seen this URL before, add it to our collection
-        if url not in url_map:
-            url_map[url] = current_url_index
-            urls.append(url)
+        if group_by_domain:
+            # Group references by domain
+            domain_groups: defaultdict[str, list[tuple[int, str]]] = defaultdict(list)
+            for url, idx in self.url_map.items():
+                domain_groups[_fast_netloc(url)].append((idx, url))
             
-            if group_by_domain:
-                domain = urlparse(url).netloc
-                if domain not in domain_groups:
-                    domain_groups[domain] = []
-                domain_groups[domain].append((current_url_index, url))
-                
-            current_url_index += 1
+            for domain, urls_in_domain in domain_groups.items():
+                parts.append(f"### {domain}\n\n")
+                for idx, url in urls_in_domain:
+                    parts.append(f"[{idx}] {url}\n\n")
+        else:
+            # Simple list of references
+            for url, idx in self.url_map.items():
+                parts.append(f"[{idx}] {url}\n\n")
         
-        # Replace with citation number
-        return f"[{url_map[url]}]"
+        return parts
+
+def _optimize_markdown(content: str, group_by_domain: bool, keep_domain_names: bool) -> tuple[str, int]:
+    """
+    Replace the URLs in Markdown text with numbered citations.
     
-    content = re.sub(raw_url_pattern, replace_raw_url, content)
+    Returns:
+        tuple: The optimized text and the number of unique URLs processed
+    """
+    if not _may_contain_urls(content, keep_domain_names):
+        return content, 0
     
-    # Add references section at the end
-    content += "\n\n## References\n\n"
+    collector = _CitationCollector(keep_domain_names)
+    content = _sub_markdown_urls(collector.replace_match, content)
     
-    if group_by_domain:
-        # Group references by domain
-        for domain, urls_in_domain in domain_groups.items():
-            content += f"### {domain}\n\n"
-            for idx, url in urls_in_domain:
-                content += f"[{idx}] {url}\n\n"
-    else:
-        # Simple list of references
-        for i, url in enumerate(urls, 1):
-            content += f"[{i}] {url}\n\n"
+    if not collector.url_map:
+        return content, 0
+    
+    # Add references section at the end, joining the pieces so the
+    # document is only copied once
+    return "".join([content, *collector.references(group_by_domain)]), len(collector.url_map)
+
+def _optimize(content: str, group_by_domain: bool, keep_domain_names: bool) -> tuple[str, int]:
+    """Run the native citation pass if available, the pure Python one otherwise."""
+    if _optimize_markdown_native is not None:
+        return _optimize_markdown_native(content, group_by_domain, keep_domain_names)
+    return _optimize_markdown(content, group_by_domain, keep_domain_names)
+
+def process_markdown_string(content: str, group_by_domain: bool = True, keep_domain_names: bool = True) -> str:
+    """
+    Process Markdown text to optimize it for RAG systems.
     
-    # Write the output file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
+    Args:
+        content (str): The Markdown text to optimize
+        group_by_domain (bool): Whether to group references by domain
+        keep_domain_names (bool): Whether to keep domain names in citations
+        
+    Returns:
+        str: The optimized Markdown text
+    """
+    return _optimize(content, group_by_domain, keep_domain_names)[0]
+
+def process_markdown_file(input_file: str, output_file: str, group_by_domain: bool = True, keep_domain_names: bool = True) -> int:
+    """
+    Process a Markdown file to optimize it for RAG systems.
+    
+    Args:
+        input_file (str): Path to the input Markdown file
+        output_file (str): Path to save the optimized output file
+        group_by_domain (bool): Whether to group references by domain
+        keep_domain_names (bool): Whether to keep domain names in citations
+        
+    Returns:
+        int: Number of unique URLs processed
+    """
+    collector = _CitationCollector(keep_domain_names)
+    
+    # Write to a temporary file next to the output and move it into place at the end, so
+    # a failed run never leaves a truncated output and input_file may be output_file
+    target = os.path.realpath(output_file)
+    tmp_path = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+    # Mode 0o666 lets the OS apply the umask, so a new output gets the permissions
+    # open(output_file, 'w') would have given it
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as dst, open(input_file, 'r', encoding='utf-8') as src:
+            # Stream the file in blocks of whole lines so only one block is held in memory;
+            # a link still open at the end of a block is carried over to the next one
+            carry = ""
+            while True:
+                lines = src.readlines(STREAM_BLOCK_CHARS)
+                block = carry + "".join(lines)
+                cut = _stream_cut(block) if lines else len(block)
+                block, carry = block[:cut], block[cut:]
+                if _may_contain_urls(block, keep_domain_names):
+                    block = _sub_markdown_urls(collector.replace_match, block)
+                dst.write(block)
+                if not lines:
+                    break
+            
+            # Add references section at the end
+            if collector.url_map:
+                dst.writelines(collector.references(group_by_domain))
+        
+        # Keep the permissions of an output that is being overwritten
+        try:
+            shutil.copymode(target, tmp_path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
     
-    return len(urls)
+    return len(collector.url_map)
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1 @@
+def optimize_markdown(content: str, group_by_domain: bool = True, keep_domain_names: bool = True) -> tuple[str, int]: ...
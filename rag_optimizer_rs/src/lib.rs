@@ -0,0 +1,26 @@
+//! Python bindings for the native Markdown citation pass.
+//!
+//! `rag_optimizer` imports `optimize_markdown` from here when the extension is
+//! installed and falls back to its pure Python implementation otherwise.
+
+use pyo3::prelude::*;
+use pyo3::pybacked::PyBackedStr;
+
+mod optimizer;
+
+/// Replace the URLs in Markdown text with numbered citations.
+///
+/// Returns the optimized text and the number of unique URLs processed.
+/// `content` is a `PyBackedStr` because the abi3 build cannot borrow `&str`
+/// from a Python string before Python 3.10.
+#[pyfunction]
+#[pyo3(signature = (content, group_by_domain=true, keep_domain_names=true))]
+fn optimize_markdown(py: Python<'_>, content: PyBackedStr, group_by_domain: bool, keep_domain_names: bool) -> (String, usize) {
+    py.allow_threads(|| optimizer::optimize_markdown(&content, group_by_domain, keep_domain_names))
+}
+
+#[pymodule]
+fn rag_optimizer_rs(m: &Bound<'_, PyModule>) -> PyResult<()> {
+    m.add_function(wrap_pyfunction!(optimize_markdown, m)?)?;
+    Ok(())
+}
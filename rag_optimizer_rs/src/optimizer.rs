@@ -0,0 +1,181 @@
+//! Pure Rust port of `rag_optimizer._optimize_markdown`.
+//!
+//! The output must stay byte-for-byte identical to the Python implementation,
+//! so every rule below mirrors a line in rag_optimizer.py.
+
+use std::collections::HashMap;
+use std::fmt::Write;
+use std::sync::OnceLock;
+
+use regex::Regex;
+
+/// Same alternation as `_MARKDOWN_URL_RE`, minus the raw URL lookbehind,
+/// which the `regex` crate does not support and is checked by hand instead.
+/// `\x1c-\x1f` are added to the raw URL classes because Python's `\s` treats
+/// them as whitespace and Unicode `\s` does not.
+fn markdown_url_re() -> &'static Regex {
+    static RE: OnceLock<Regex> = OnceLock::new();
+    RE.get_or_init(|| {
+        Regex::new(concat!(
+            r"(?P<link>\[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)]+)\))",
+            r"|(?P<citation>(?P<citation_domain>[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})\[(?P<citation_num>\d+)\])",
+            r#"|(?P<raw_url>https?://"#,
+            r#"(?:[^\s\x1c-\x1f<>"'()\]]|\([^\s\x1c-\x1f<>"'()\]]*\))*"#,
+            r#"(?:[^\s\x1c-\x1f<>"'()\].,;:!?]|\([^\s\x1c-\x1f<>"'()\]]*\)))"#,
+        ))
+        .expect("markdown URL pattern is valid")
+    })
+}
+
+/// Python's `(?<![(\w])` lookbehind on raw URLs: the URL may not directly
+/// follow an opening parenthesis or a word character. `char::is_alphanumeric`
+/// stands in for Python's `str.isalnum`; they only disagree on a few combining
+/// marks, which never precede a URL in practice.
+fn raw_url_allowed_at(content: &str, start: usize) -> bool {
+    match content[..start].chars().next_back() {
+        Some(c) => !(c == '(' || c == '_' || c.is_alphanumeric()),
+        None => true,
+    }
+}
+
+/// Port of `urlsplit(url).netloc` for the URLs `_fast_netloc` hands to `urlparse`.
+fn urlparse_netloc(url: &str) -> String {
+    let url: String = url
+        .trim_start_matches(|c: char| c <= ' ')
+        .chars()
+        .filter(|&c| c != '\t' && c != '\r' && c != '\n')
+        .collect();
+
+    let mut rest = url.as_str();
+    if let Some(colon) = rest.find(':') {
+        let scheme = &rest[..colon];
+        let mut chars = scheme.chars();
+        let valid = matches!(chars.next(), Some(c) if c.is_ascii_alphabetic())
+            && chars.all(|c| c.is_ascii_alphanumeric() || c == '+' || c == '-' || c == '.');
+        if valid {
+            rest = &rest[colon + 1..];
+        }
+    }
+
+    match rest.strip_prefix("//") {
+        Some(after) => {
+            let end = after.find(|c| c == '/' || c == '?' || c == '#').unwrap_or(after.len());
+            after[..end].to_string()
+        }
+        None => String::new(),
+    }
+}
+
+/// Port of `_fast_netloc`.
+fn fast_netloc(url: &str) -> String {
+    // urlparse drops tabs and line breaks, which a link URL may contain
+    if url.contains(['\t', '\r', '\n']) {
+        return urlparse_netloc(url);
+    }
+    let after = match url.strip_prefix("https://").or_else(|| url.strip_prefix("http://")) {
+        Some(after) => after,
+        None => return urlparse_netloc(url),
+    };
+    let end = after.find(|c| c == '/' || c == '?' || c == '#').unwrap_or(after.len());
+    after[..end].to_string()
+}
+
+/// Return the citation number for a URL, adding it to the collection if it is new.
+fn cite<'a>(url: &'a str, urls: &mut Vec<&'a str>, url_map: &mut HashMap<&'a str, usize>) -> usize {
+    // Remove any anchors
+    let url = match url.find('#') {
+        Some(anchor) => &url[..anchor],
+        None => url,
+    };
+    *url_map.entry(url).or_insert_with(|| {
+        urls.push(url);
+        urls.len()
+    })
+}
+
+/// Replace the URLs in Markdown text with numbered citations.
+///
+/// Returns the optimized text and the number of unique URLs processed.
+pub fn optimize_markdown(content: &str, group_by_domain: bool, keep_domain_names: bool) -> (String, usize) {
+    // Nothing to cite: every link needs "](", every raw URL starts with "http" and
+    // domain[citation] patterns only change when domain names are dropped
+    if !content.contains("](") && !content.contains("http") && (keep_domain_names || !content.contains('[')) {
+        return (content.to_string(), 0);
+    }
+
+    // Each unique URL in order of first appearance; its citation number is its position + 1.
+    // Keys borrow from `content`, so collecting a URL never copies it
+    let mut urls: Vec<&str> = Vec::new();
+    let mut url_map: HashMap<&str, usize> = HashMap::new();
+
+    let mut out = String::with_capacity(content.len());
+    let mut last = 0;
+    let mut pos = 0;
+    let re = markdown_url_re();
+
+    while let Some(caps) = re.captures_at(content, pos) {
+        let whole = caps.get(0).expect("group 0 always participates");
+
+        if caps.name("raw_url").is_some() && !raw_url_allowed_at(content, whole.start()) {
+            // Python would fail the lookbehind here and keep scanning from the next character
+            pos = whole.start() + 1;
+            continue;
+        }
+
+        out.push_str(&content[last..whole.start()]);
+
+        if let Some(url) = caps.name("link_url") {
+            let index = cite(url.as_str(), &mut urls, &mut url_map);
+            let text = caps.name("link_text").expect("link_text participates with link_url").as_str();
+            let _ = write!(out, "{}[{}]", text, index);
+        } else if let Some(url) = caps.name("raw_url") {
+            let index = cite(url.as_str(), &mut urls, &mut url_map);
+            let _ = write!(out, "[{}]", index);
+        } else if keep_domain_names {
+            out.push_str(whole.as_str());
+        } else {
+            let num = caps.name("citation_num").expect("citation_num participates with citation").as_str();
+            let _ = write!(out, "[{}]", num);
+        }
+
+        last = whole.end();
+        pos = whole.end();
+    }
+    out.push_str(&content[last..]);
+
+    if urls.is_empty() {
+        return (out, 0);
+    }
+
+    // Add references section at the end
+    out.push_str("\n\n## References\n\n");
+
+    if group_by_domain {
+        // Group references by domain, keeping domains in order of first appearance
+        let mut domain_index: HashMap<String, usize> = HashMap::new();
+        let mut domain_groups: Vec<(String, Vec<(usize, &str)>)> = Vec::new();
+        for (i, url) in urls.iter().enumerate() {
+            let domain = fast_netloc(url);
+            let slot = *domain_index.entry(domain.clone()).or_insert_with(|| {
+                domain_groups.push((domain, Vec::new()));
+                domain_groups.len() - 1
+            });
+            domain_groups[slot].1.push((i + 1, url));
+        }
+
+        for (domain, urls_in_domain) in &domain_groups {
+            let _ = write!(out, "### {}\n\n", domain);
+            for (idx, url) in urls_in_domain {
+                let _ = write!(out, "[{}] {}\n\n", idx, url);
+            }
+        }
+    } else {
+        // Simple list of references
+        for (i, url) in urls.iter().enumerate() {
+            let _ = write!(out, "[{}] {}\n\n", i + 1, url);
+        }
+    }
+
+    let count = urls.len();
+    (out, count)
+}
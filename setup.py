@@ -1,5 +1,14 @@
+import os
 from setuptools import setup, find_packages
 
+# Optionally compile rag_optimizer.py to a C extension with mypyc
+# (RAG_OPTIMIZER_USE_MYPYC=1 pip install --no-build-isolation .); the pure Python
+# module is used otherwise
+ext_modules = []
+if os.environ.get("RAG_OPTIMIZER_USE_MYPYC") == "1":
+    from mypyc.build import mypycify
+    ext_modules = mypycify(["rag_optimizer.py"])
+
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
 
@@ -16,6 +25,12 @@ setup(
     long_description_content_type="text/markdown",
     url="https://github.com/gptkitty/openai-doc-optimizer",
     packages=find_packages(),
+    py_modules=["rag_optimizer"],
+    ext_modules=ext_modules,
+    extras_require={
+        # SIMD prefilter for the URL scan in the pure Python implementation
+        "hyperscan": ["hyperscan"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",
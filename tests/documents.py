@@ -0,0 +1,74 @@
+"""Markdown inputs and the output check shared by the equivalence tests."""
+
+import itertools
+import random
+
+import rag_optimizer
+
+SAMPLE = """# Research Notes
+
+Deep research reports cite [their sources](https://example.com/articles/one#section-2)
+inline, repeat [the same source](https://example.com/articles/one) and mention
+raw URLs such as https://en.wikipedia.org/wiki/Foo_(bar), (https://docs.python.org/3/)
+and http://user@host.example:8080/path?q=1. Some end a sentence: https://b.org/x.
+
+Domain citations look like example.com[1] or sub.domain.org[12].
+
+| Source | Link |
+|--------|------|
+| Docs | [Python](https://docs.python.org/3/library/re.html) |
+| Café | https://café.example/ü |
+
+A link may wrap: [the paper](https://exam
+ple.com/paper).
+
+Not URLs: ftp://files.example/x, mailto:someone@example.com, xhttps://nope.example.
+"""
+
+# Fragments that exercise the edges of each URL pattern when glued together at random
+_FRAGMENTS = [
+    "[", "]", "(", ")", "](", "_(b)", "(x)", ")(", "[t](u)", "[2]", "ex.com[3]",
+    "http://", "https://", "https://w.org/F_(b)", "(http://a.b)", "http://u@h:80/",
+    "ftp://h/x", "//host/p", "[t](https://a\t.b/c)", "[t](http://a\r\n.b)", "mailto:a@b", "xhttp://z.q", "https://é.com/ü",
+    "a.com", "x.org/p", "b.c", "#f", "?q=1", " ", " \t", "\n", ",", ".", "!", "-",
+    "_", "x", "a", '"', "'", "<", ">", "\x1c", "é", "١", "…", "😀",
+]
+
+
+def random_documents(seed, count=500):
+    """Return reproducible random documents built from URL-like fragments"""
+    rng = random.Random(seed)
+    return ["".join(rng.choices(_FRAGMENTS, k=rng.randint(0, 60))) for _ in range(count)]
+
+
+class EquivalenceChecks:
+    """Mixin for TestCase classes comparing a candidate citation pass with a reference.
+
+    Subclasses override candidate() and, if the reference is not the pure
+    Python pass, reference(); both take (content, group_by_domain, keep_domain_names).
+    """
+
+    seed = 0
+
+    def reference(self, content, group_by_domain, keep_domain_names):
+        return rag_optimizer._optimize_markdown(content, group_by_domain, keep_domain_names)
+
+    def candidate(self, content, group_by_domain, keep_domain_names):
+        raise NotImplementedError
+
+    def assert_same_output(self, content):
+        for group_by_domain, keep_domain_names in itertools.product([True, False], repeat=2):
+            try:
+                expected = self.reference(content, group_by_domain, keep_domain_names)
+            except ValueError:
+                # urlparse rejects some malformed netlocs, e.g. an unclosed "["
+                continue
+            actual = self.candidate(content, group_by_domain, keep_domain_names)
+            self.assertEqual(actual, expected, (content, group_by_domain, keep_domain_names))
+
+    def test_sample(self):
+        self.assert_same_output(SAMPLE)
+
+    def test_random_documents(self):
+        for content in random_documents(self.seed):
+            self.assert_same_output(content)
@@ -0,0 +1,23 @@
+"""Check that the Hyperscan prefilter does not change the citation pass output."""
+
+import unittest
+from unittest import mock
+
+import rag_optimizer
+from documents import EquivalenceChecks
+
+
+@unittest.skipIf(rag_optimizer._hyperscan_db is None, "hyperscan is not installed")
+class HyperscanEquivalenceTest(EquivalenceChecks, unittest.TestCase):
+    seed = 19
+
+    def reference(self, content, group_by_domain, keep_domain_names):
+        with mock.patch.object(rag_optimizer, "_hyperscan_db", None):
+            return rag_optimizer._optimize_markdown(content, group_by_domain, keep_domain_names)
+
+    def candidate(self, content, group_by_domain, keep_domain_names):
+        return rag_optimizer._optimize_markdown(content, group_by_domain, keep_domain_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,24 @@
+"""Check that the Rust extension matches the pure Python citation pass."""
+
+import unittest
+
+from documents import EquivalenceChecks
+
+# Import the function, not the module: from the repository root the crate's
+# source directory would otherwise be picked up as an empty namespace package
+try:
+    from rag_optimizer_rs import optimize_markdown as native_optimize_markdown
+except ImportError:
+    native_optimize_markdown = None
+
+
+@unittest.skipIf(native_optimize_markdown is None, "rag_optimizer_rs is not installed")
+class NativeEquivalenceTest(EquivalenceChecks, unittest.TestCase):
+    seed = 18
+
+    def candidate(self, content, group_by_domain, keep_domain_names):
+        return native_optimize_markdown(content, group_by_domain, keep_domain_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+"""Check the urlparse shortcut used to group references by domain."""
+
+import unittest
+from urllib.parse import urlparse
+
+import rag_optimizer
+from documents import SAMPLE, random_documents
+
+
+class FastNetlocTest(unittest.TestCase):
+    def assert_matches_urlparse(self, url):
+        try:
+            expected = urlparse(url).netloc
+        except ValueError:
+            return
+        self.assertEqual(rag_optimizer._fast_netloc(url), expected, url)
+
+    def test_link_url_with_line_break(self):
+        self.assertEqual(rag_optimizer._fast_netloc("https://exam\nple.com/paper"), "example.com")
+
+    def test_document_urls(self):
+        for content in [SAMPLE] + random_documents(seed=5):
+            for match in rag_optimizer._MARKDOWN_URL_RE.finditer(content):
+                url = match.group('link_url') or match.group('raw_url')
+                if url:
+                    self.assert_matches_urlparse(url)
+
+
+if __name__ == "__main__":
+    unittest.main()
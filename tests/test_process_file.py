@@ -0,0 +1,98 @@
+"""Check the streaming file path of the citation pass."""
+
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import rag_optimizer
+from documents import random_documents
+
+
+def _long_documents(seed, count=100, parts=12):
+    """Return random documents long enough to span many small blocks"""
+    documents = random_documents(seed, count * parts)
+    return ["".join(documents[i:i + parts]) for i in range(0, len(documents), parts)]
+
+
+class ProcessMarkdownFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        # Tiny blocks so every document is streamed through many of them
+        patcher = mock.patch.object(rag_optimizer, "STREAM_BLOCK_CHARS", 64)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(self.tmp, name)
+
+    def write(self, name, data):
+        with open(self.path(name), 'wb') as f:
+            f.write(data if isinstance(data, bytes) else data.encode('utf-8'))
+
+    def read(self, name):
+        with open(self.path(name), encoding='utf-8') as f:
+            return f.read()
+
+    def test_matches_in_memory_pass(self):
+        for content in _long_documents(seed=20):
+            self.write('in.md', content)
+            # Compare with the text as read back, since reading translates "\r" line endings
+            text = self.read('in.md')
+            for group_by_domain, keep_domain_names in itertools.product([True, False], repeat=2):
+                try:
+                    expected = rag_optimizer._optimize_markdown(text, group_by_domain, keep_domain_names)
+                except ValueError:
+                    # urlparse rejects some malformed netlocs, e.g. an unclosed "["
+                    continue
+                count = rag_optimizer.process_markdown_file(
+                    self.path('in.md'), self.path('out.md'), group_by_domain, keep_domain_names
+                )
+                self.assertEqual((self.read('out.md'), count), expected, (content, group_by_domain, keep_domain_names))
+
+    def test_link_spanning_blocks(self):
+        # The "[" opened on the first line only closes in the last block
+        content = "[citation needed\n" + "Filler text without any brackets.\n" * 10 + "See [foo](https://example.com/a\nb).\n"
+        self.write('in.md', content)
+        count = rag_optimizer.process_markdown_file(self.path('in.md'), self.path('out.md'))
+        self.assertEqual((self.read('out.md'), count), rag_optimizer._optimize_markdown(content, True, True))
+
+    def test_in_place(self):
+        content = "".join(
+            f"Line {i} cites [a source](https://example.com/{i % 7}) and https://b.org/{i % 5}.\n"
+            for i in range(50)
+        )
+        self.write('doc.md', content)
+        count = rag_optimizer.process_markdown_file(self.path('doc.md'), self.path('doc.md'))
+        self.assertEqual((self.read('doc.md'), count), rag_optimizer._optimize_markdown(content, True, True))
+
+    def test_invalid_utf8_leaves_output_untouched(self):
+        self.write('in.md', b"See https://example.com/a\n" * 20 + b"\xff\xfe\n")
+        self.write('out.md', "previous output\n")
+        with self.assertRaises(UnicodeDecodeError):
+            rag_optimizer.process_markdown_file(self.path('in.md'), self.path('out.md'))
+        self.assertEqual(self.read('out.md'), "previous output\n")
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['in.md', 'out.md'])
+
+    @unittest.skipUnless(os.name == 'posix', "POSIX file modes")
+    def test_output_mode(self):
+        self.write('in.md', "See https://example.com/a\n")
+        old_umask = os.umask(0o027)
+        try:
+            rag_optimizer.process_markdown_file(self.path('in.md'), self.path('new.md'))
+        finally:
+            os.umask(old_umask)
+        self.assertEqual(os.stat(self.path('new.md')).st_mode & 0o777, 0o640)
+
+        # An existing output keeps its own permissions
+        self.write('old.md', "previous output\n")
+        os.chmod(self.path('old.md'), 0o604)
+        rag_optimizer.process_markdown_file(self.path('in.md'), self.path('old.md'))
+        self.assertEqual(os.stat(self.path('old.md')).st_mode & 0o777, 0o604)
+
+
+if __name__ == "__main__":
+    unittest.main()